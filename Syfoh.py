@@ -77,6 +77,16 @@ def invertDict(d:dict):
             revDict[v] = k
     return revDict
 
+def float2str(value:float):
+    # Shortest text that gives back the same 32bit float. Using repr of the result ensures that the
+    # text always contains a "." or exponent; otherwise str2sysexDict would treat it as integer.
+    packed = struct.pack("<f", value)
+    for digits in range(1, 10):
+        text = "{:.{}g}".format(value, digits)
+        if struct.pack("<f", float(text)) == packed:
+            break
+    return repr(float(text))
+
 def sysexDict2str(d:dict):
     readCommands = {v:k for k,v in {"check": 0x02, "read": 0x03, "get": 0x04}.items()}
     targets = {127: "all"}
@@ -128,22 +138,27 @@ def sysexDict2str(d:dict):
     s.append(targetPrefix)
     s.append("device")
     s.append(targets[d["deviceID"]])
-    s.append("and")
     if cmdType != "reply" and cmdNum in mapping:
-        s.append(mapping[cmdNum]["targetMSB-name"])
-        msbDict = invertDict(mapping[cmdNum]["targetMSB"])
-        if d["targetMSB"] in msbDict:
-            s.append(msbDict[d["targetMSB"]])
-        else:
-            s.append(targets[d["targetMSB"]])
-        s.append("and")
-        s.append(mapping[cmdNum]["targetLSB-name"])
-        lsbDict = invertDict(mapping[cmdNum]["targetLSB"])
-        if d["targetLSB"] in lsbDict:
-            s.append(lsbDict[d["targetLSB"]])
-        else:
-            s.append(targets[d["targetLSB"]])
+        # Targets without name aren't used by this command and are omitted. Otherwise the result
+        # couldn't be parsed again by str2sysexDict.
+        if mapping[cmdNum]["targetMSB-name"]:
+            s.append("and")
+            s.append(mapping[cmdNum]["targetMSB-name"])
+            msbDict = invertDict(mapping[cmdNum]["targetMSB"])
+            if d["targetMSB"] in msbDict:
+                s.append(msbDict[d["targetMSB"]])
+            else:
+                s.append(targets[d["targetMSB"]])
+        if mapping[cmdNum]["targetLSB-name"]:
+            s.append("and")
+            s.append(mapping[cmdNum]["targetLSB-name"])
+            lsbDict = invertDict(mapping[cmdNum]["targetLSB"])
+            if d["targetLSB"] in lsbDict:
+                s.append(lsbDict[d["targetLSB"]])
+            else:
+                s.append(targets[d["targetLSB"]])
     else:
+        s.append("and")
         s.append("targetMSB")
         s.append(targets[d["targetMSB"]])
         s.append("and")
@@ -157,7 +172,15 @@ def sysexDict2str(d:dict):
 
     if cmdType not in ("read", "check_reply"):
         if isFloat:
-            s.append(str(struct.unpack("<f", struct.pack("<I", d["value"]))))
+            value = d["value"]
+            # bytes2sysexDict already converts float commands.
+            if type(value) != float:
+                value = struct.unpack("<f", struct.pack("<I", value))[0]
+            s.append(float2str(value))
+        elif cmdNum in mapping and mapping[cmdNum]["type"] == "str":
+            # Reverse of the string packing in str2sysexDict. Unused characters are zero.
+            value = (d["value"] & 0xffffffff).to_bytes(4, "little")
+            s.append(value.decode("iso-8859-1").rstrip("\x00"))
         else:
             valDict = dict()
             if cmdNum in mapping:
@@ -225,7 +248,7 @@ def str2sysexDict(s:str):
         for t in targets:
             t["val"] = t["val"].replace("all", "127")
             if t["name"] == "device":
-                n = findInt(s[1])
+                n = findInt(t["val"])
                 if n is None:
                     return -1
                 sysex["deviceID"] = n
@@ -325,6 +348,143 @@ def sysex2fileOrConsole(data:bytes, mode:str, file=None, dir="Out", index=0, cmd
         prefix += ":"
         print(prefix, data)
 
+def serialBulkWrite(ser, frames:list, gap:float):
+    # Generator; yields the number of commands written so far. This way the caller still knows how many
+    # commands have been sent if the upload is aborted.
+    # Time needed to transmit a single byte (start bit + 8 data bits + stop bit).
+    byteTime = 10 / ser.baudrate
+    if gap <= 0:
+        # No idle time required; let the OS stream the entire batch.
+        ser.write(b"".join(frames))
+        yield len(frames)
+    else:
+        # Each command is written when its deadline is reached. The deadline includes the transmission
+        # time of the previous command, thus there's no need to poll out_waiting. Sleeping instead of
+        # spinning keeps the CPU idle. The next deadline is based on the time the write actually finished;
+        # if a write or sleep is late, the following commands are delayed instead of catching up. This way
+        # the idle time between two commands is never shorter than the given gap.
+        deadline = time.perf_counter()
+        for i,f in enumerate(frames):
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            ser.write(f)
+            deadline = max(deadline, time.perf_counter()) + len(f) * byteTime + gap
+            yield i + 1
+    # Block until everything has been transmitted.
+    ser.flush()
+
+# Parameters that are not part of a snapshot. Replaying them makes no sense or is even harmful.
+snapshotExclude = (
+    names2num["midi-chn-nrp-rst"],  # Action: resets the NRPs of the given channels.
+    names2num["dev-reset"],         # Action: resets the device.
+    names2num["dev-time"],          # Read-only
+    names2num["dev-fw-version"],    # Read-only
+    names2num["coil-active-tones"], # Read-only
+    names2num["coil-active-duty"],  # Read-only
+)
+
+def snapshotRequests():
+    # Cover all known parameters with as few range requests as possible. A range returns either
+    # integer or float commands, thus it has to be split whenever the type changes.
+    ranges = []
+    split = True
+    for num in sorted(mapping):
+        if num in snapshotExclude:
+            split = True
+            continue
+        if mapping[num]["type"] == "float":
+            num |= 0x2000
+        if split or (ranges[-1][1] ^ num) & 0x2000:
+            ranges.append([num, num])
+        else:
+            ranges[-1][1] = num
+        split = False
+
+    cmds = []
+    for lower, upper in ranges:
+        value = lower
+        if upper != lower:
+            value |= upper << 16
+        # All targets (including the device) are wildcards.
+        cmd = {"number": 0x04, "targetMSB": 127, "targetLSB": 127, "value": value, "deviceID": 127, "reading": 0x04}
+        cmd["bin"] = sysexBytes(**cmd)
+        cmds.append(cmd)
+    return cmds
+
+def snapshot(cmds:list, send, receive, gap=0.04, quiet=0.5):
+    # Replies are collected while the remaining requests are still being sent. Collecting only stops
+    # once all requests have been sent and no data has been received for the given quiet time.
+    buffer = b""
+    frames = []
+    nextTx = time.perf_counter()
+    lastRx = nextTx
+    i = 0
+    try:
+        while i < len(cmds) or time.perf_counter() - lastRx < quiet:
+            now = time.perf_counter()
+            if i < len(cmds) and now >= nextTx:
+                send(cmds[i]["bin"])
+                i += 1
+                nextTx = now + gap
+                lastRx = now
+            data = receive()
+            if not data:
+                time.sleep(0.001)
+                continue
+            # Incoming data could be a list (f.ex. when it comes from the midirt library).
+            buffer += bytes(data)
+            lastRx = time.perf_counter()
+            # Serial data arrives in arbitrary chunks; split it into 16 byte sysex commands.
+            while True:
+                start = buffer.find(0xf0)
+                if start < 0:
+                    buffer = b""
+                    break
+                buffer = buffer[start:]
+                if len(buffer) < 16:
+                    break
+                if buffer[15] == 0xf7:
+                    frames.append(buffer[:16])
+                    buffer = buffer[16:]
+                else:
+                    buffer = buffer[1:]
+
+    except KeyboardInterrupt:
+        # Keep everything received so far.
+        print("\nUser aborted snapshot by keyboard interrupt. Saving incomplete snapshot.")
+
+    # Only keep the commands sent by the device. Anything else (f.ex. echoed requests) can't be replayed.
+    result = []
+    for f in frames:
+        d = bytes2sysexDict(f)
+        if d["valid"] and d["protocolVer"] == 1 and (d["number"] & ~0x2000) > 0x04:
+            result.append(f)
+    # Also return the number of requests sent, which is less than len(cmds) if the snapshot was aborted.
+    return result, i
+
+def saveSnapshot(frames:list, file:Path):
+    with open(file.with_suffix(".txt"), "w") as f:
+        f.write("# Syfoh snapshot, {}\n".format(time.strftime("%Y-%m-%d %H:%M:%S")))
+        for e in frames:
+            f.write(sysexDict2str(bytes2sysexDict(e)) + "\n")
+    with open(file.with_suffix(".syx"), "wb") as f:
+        f.write(b"".join(frames))
+
+def snapshot2file(cmds:list, send, receive, file:Path, logOut=True, logIndex=True):
+    if logOut:
+        for i,e in enumerate(cmds):
+            log_index = 0
+            if logIndex:
+                log_index = i + 1
+            sysex2fileOrConsole(e["bin"], "HEX", None, "Out", log_index)
+    snapshotTime = time.time()
+    frames, txCounter = snapshot(cmds, send, receive)
+    saveSnapshot(frames, file)
+    print("Received {} command(s) in {:.1f}s. Saved snapshot as \"{}\" and \"{}\".".format(
+          len(frames), time.time() - snapshotTime, file.with_suffix(".txt"), file.with_suffix(".syx")))
+    return txCounter
+
 
 if __name__ == "__main__":
     desc = """Sysex-Tool for Syntherrupter
@@ -368,6 +528,20 @@ if __name__ == "__main__":
                         help="Use this flag to disable the index number on all console messages. The index is the "
                              "number of the command. 1=first, 2=second, etc. This way you can quickly associate the "
                              "log info with the respective command from your input file. ")
+    parser.add_argument("--bulk", required=False, type=float, nargs="?", const=0.04, default=None,
+                        help="Serial only. Send a batch of set commands with a fixed idle time between two "
+                             "commands instead of waiting for each command to be transmitted. Optionally specify the "
+                             "idle time in seconds (default: 0.04, same pacing as without --bulk; only smaller values "
+                             "make the upload faster). 0 writes the whole batch at once as one buffer. "
+                             "Syfoh doesn't check whether the commands have been processed; if the idle time is too "
+                             "short, commands get lost silently. Requires UI updates to be disabled. Read commands "
+                             "and -r/--receive are not supported.")
+    parser.add_argument("--snapshot", required=False, action="store_true",
+                        help="Export the entire configuration of all connected devices. Requires SER/SERIAL or "
+                             "MID/MIDI mode and an output file (-o/--output). The configuration is saved both as "
+                             "Syfoh text file (.txt) and as binary file (.syx). Only the .txt file can be used as "
+                             "input for Syfoh; the .syx file is meant for other MIDI/sysex tools. "
+                             "Cannot be combined with -i/--input or -r/--receive.")
 
     args = parser.parse_args()
 
@@ -403,7 +577,7 @@ if __name__ == "__main__":
 
     if not args.mode:
         parser.error("-m/--mode is required.")
-    if not args.input:
+    if not args.input and not args.snapshot:
         parser.error("-i/--input is required.")
 
     args.mode = args.mode[:3].upper()
@@ -415,18 +589,38 @@ if __name__ == "__main__":
         parser.error("Invalid mode. To receive data you must select SER/SERIAL or MID/MIDI (case insensitive).")
     if args.receive not in ["", "HEX", "PAR", "VAL", "BIN", "SYX"]:
         parser.error("Invalid receive mode. Must be HEX, PAR/PARSED, VAL/VALUE or BIN/SYX (case insensitive).")
-    if args.receive and args.mode == "MID" and not args.port_in:
+    if (args.receive or args.snapshot) and args.mode == "MID" and not args.port_in:
         parser.error("Input MIDI port missing. See -h/--help for details about the input port.")
 
-    if args.port_in and not args.receive:
+    if args.port_in and not (args.receive or args.snapshot):
         parser.error("-q/--port-in requires -r/--receive.")
     if args.watch and not args.receive:
         parser.error("-w/--watch requires -r/--receive.")
     if args.watch and args.watch < 0.1:
         parser.error("Watch interval cannot be shorter than 0.1s (100ms)")
+    if args.bulk is not None and args.mode != "SER":
+        parser.error("--bulk requires -m/--mode SER/SERIAL.")
+    if args.bulk is not None and args.bulk < 0:
+        parser.error("--bulk idle time cannot be negative.")
+    if args.bulk is not None and args.receive:
+        parser.error("--bulk cannot be combined with -r/--receive.")
+    if args.snapshot:
+        if args.mode not in ("SER", "MID"):
+            parser.error("--snapshot requires -m/--mode SER/SERIAL or MID/MIDI.")
+        if not args.output:
+            parser.error("--snapshot requires -o/--output.")
+        if args.watch or args.bulk is not None:
+            parser.error("--snapshot cannot be combined with -w/--watch or --bulk.")
+        if args.input:
+            parser.error("--snapshot cannot be combined with -i/--input.")
+        if args.receive:
+            parser.error("--snapshot cannot be combined with -r/--receive.")
 
     if args.output:
         out = Path(args.output)
+        if args.snapshot:
+            # Snapshots are saved as .txt and .syx file. The .syx file is written by saveSnapshot.
+            out = out.with_suffix(".txt")
         try:
             # make sure the file exists and is blank.
             with open(out, "w") as f:
@@ -443,11 +637,17 @@ if __name__ == "__main__":
     if p.is_file():
         with open(p) as f:
             strs = [cmd.rstrip("\n") for cmd in f.readlines()]
-    else:
+    elif args.input:
         strs.append(args.input)
 
     cmds = []
     validStrs = []
+    if args.snapshot:
+        cmds = snapshotRequests()
+        for e in cmds:
+            lower = e["value"] & 0xffff
+            upper = (e["value"] >> 16) or lower
+            validStrs.append("parameters 0x{:04x}-0x{:04x} of all devices and targets".format(lower, upper))
     for i,e in enumerate(strs):
         e = str2sysexDict(e)
         if e == -1:
@@ -459,7 +659,10 @@ if __name__ == "__main__":
             cmds.append(e)
 
     print("")
-    print("Valid commands ({}):".format(len(cmds)))
+    if args.snapshot:
+        print("Snapshot ranges ({}):".format(len(cmds)))
+    else:
+        print("Valid commands ({}):".format(len(cmds)))
     for i,e in enumerate(validStrs):
         prefix = "Set"
         if cmds[i]["reading"]:
@@ -472,6 +675,8 @@ if __name__ == "__main__":
 
     if not len(cmds):
         exit()
+    if args.bulk is not None and any(e["reading"] for e in cmds):
+        parser.error("--bulk only supports set commands.")
 
     if args.log_no_out:
         print("Incoming Data:")
@@ -528,52 +733,68 @@ if __name__ == "__main__":
         else:
             # loop time needs to be >0 nonetheless
             args.watch = 1
-        try:
-            # do-while loop; break condition is at the bottom of the loop.
-            while True:
-                loopTime = time.time()
-                for i,e in enumerate(cmds):
-                    # (for watch mode) set commands (a.k.a. non-read commands) are deleted after they've been sent.
-                    # Thus, skip any empty "leftovers". They're not removed to keep the log_index working.
-                    if not e:
-                        continue
-                    # log index
+        if args.snapshot:
+            txCounter = snapshot2file(cmds, serOut.write, lambda: serIn.read(serIn.in_waiting), out,
+                                      not args.log_no_out, not args.log_no_index)
+        elif args.bulk is not None:
+            for i,e in enumerate(cmds):
+                if not args.log_no_out:
                     log_index = i + 1
                     if args.log_no_index:
                         log_index = 0
-                    if not e["reading"]:
-                        # this does not affect e which will be used in this iteration.
-                        cmds[i] = None
-                        sysex2fileOrConsole(e["bin"], "HEX", None, "Out", log_index)
-                    serOut.write(e["bin"])
-                    txCounter += 1
-                    while serOut.out_waiting:
-                        pass
-                    # Let Syntherrupter process the data
-                    time.sleep(0.04)
-                    # read incoming data if there is any
-                    if portInOk:
-                        timeout = 0.04
-                        start = time.time()
-                        while time.time() - start < timeout:
-                            if serIn.in_waiting < 16:
-                                continue
-                            data = serIn.read(16)
-                            expectFloat = e["number"] & 0x2000
-                            if e["reading"]:
-                                expectFloat = e["value"] & 0x2000
-                            sysex2fileOrConsole(data, args.receive, args.output, "In", log_index, e["reading"], expectFloat)
+                    sysex2fileOrConsole(e["bin"], "HEX", None, "Out", log_index)
+            try:
+                for txCounter in serialBulkWrite(serOut, [e["bin"] for e in cmds], args.bulk):
+                    pass
+            except KeyboardInterrupt:
+                print("\nUser aborted upload by keyboard interrupt.")
+        else:
+            try:
+                # do-while loop; break condition is at the bottom of the loop.
+                while True:
+                    loopTime = time.time()
+                    for i,e in enumerate(cmds):
+                        # (for watch mode) set commands (a.k.a. non-read commands) are deleted after they've been sent.
+                        # Thus, skip any empty "leftovers". They're not removed to keep the log_index working.
+                        if not e:
+                            continue
+                        # log index
+                        log_index = i + 1
+                        if args.log_no_index:
+                            log_index = 0
+                        if not e["reading"]:
+                            # this does not affect e which will be used in this iteration.
+                            cmds[i] = None
+                            sysex2fileOrConsole(e["bin"], "HEX", None, "Out", log_index)
+                        serOut.write(e["bin"])
+                        txCounter += 1
+                        while serOut.out_waiting:
+                            pass
+                        # Let Syntherrupter process the data
+                        time.sleep(0.04)
+                        # read incoming data if there is any
+                        if portInOk:
+                            timeout = 0.04
                             start = time.time()
-
-                if not looping:
-                    # abort after 1 iteration without waiting
-                    break
-                # Measure how much time is left from the loop interval and sleep during the remaining time.
-                # Additionally set a lower limit of 0
-                freeTime = max(0, args.watch - (time.time() - loopTime))
-                time.sleep(freeTime)
-        except KeyboardInterrupt:
-            print("\nUser aborted watching by keyboard interrupt.")
+                            while time.time() - start < timeout:
+                                if serIn.in_waiting < 16:
+                                    continue
+                                data = serIn.read(16)
+                                expectFloat = e["number"] & 0x2000
+                                if e["reading"]:
+                                    expectFloat = e["value"] & 0x2000
+                                sysex2fileOrConsole(data, args.receive, args.output, "In", log_index, e["reading"], expectFloat)
+                                start = time.time()
+
+                    if not looping:
+                        # abort after 1 iteration without waiting
+                        break
+                    # Measure how much time is left from the loop interval and sleep during the remaining time.
+                    # Additionally set a lower limit of 0
+                    freeTime = max(0, args.watch - (time.time() - loopTime))
+                    time.sleep(freeTime)
+            except KeyboardInterrupt:
+                print("\nUser aborted watching by keyboard interrupt.")
         serOut.close()
         serIn.close()
         print("Sent {} command(s) to serial port.".format(txCounter))
@@ -623,49 +844,53 @@ if __name__ == "__main__":
         else:
             # loop time needs to be >0 nonetheless
             args.watch = 1
-        try:
-            # do-while loop; break condition is at the bottom of the loop.
-            while True:
-                loopTime = time.time()
-                for i,e in enumerate(cmds):
-                    # (for watch mode) process non-read commands only once.
-                    if not e:
-                        continue
-                    # log index
-                    log_index = i + 1
-                    if args.log_no_index:
-                        log_index = 0
-                    if not e["reading"]:
-                        # this does not affect e which will be used in this iteration.
-                        cmds[i] = None
-                    if not args.log_no_out:
-                        sysex2fileOrConsole(e["bin"], "HEX", None, "Out", log_index)
-                    midiOut.send_message(e["bin"])
-                    txCounter += 1
-                    # Let Syntherrupter process the data
-                    time.sleep(0.04)
-                    # read incoming data if there is any
-                    if portInOk:
-                        timeout = 0.04
-                        start = time.time()
-                        while time.time() - start < timeout:
-                            msg = midiIn.get_message()
-                            if not msg:
-                                continue
-                            expectFloat = e["number"] & 0x2000
-                            if e["reading"]:
-                                expectFloat = e["value"] & 0x2000
-                            sysex2fileOrConsole(msg[0], args.receive, args.output, "In", log_index, e["reading"], expectFloat)
+        if args.snapshot:
+            txCounter = snapshot2file(cmds, midiOut.send_message, lambda: (midiIn.get_message() or [b""])[0], out,
+                                      not args.log_no_out, not args.log_no_index)
+        else:
+            try:
+                # do-while loop; break condition is at the bottom of the loop.
+                while True:
+                    loopTime = time.time()
+                    for i,e in enumerate(cmds):
+                        # (for watch mode) process non-read commands only once.
+                        if not e:
+                            continue
+                        # log index
+                        log_index = i + 1
+                        if args.log_no_index:
+                            log_index = 0
+                        if not e["reading"]:
+                            # this does not affect e which will be used in this iteration.
+                            cmds[i] = None
+                        if not args.log_no_out:
+                            sysex2fileOrConsole(e["bin"], "HEX", None, "Out", log_index)
+                        midiOut.send_message(e["bin"])
+                        txCounter += 1
+                        # Let Syntherrupter process the data
+                        time.sleep(0.04)
+                        # read incoming data if there is any
+                        if portInOk:
+                            timeout = 0.04
                             start = time.time()
-                if not looping:
-                    # abort after 1 iteration without waiting.
-                    break
-                # Measure how much time is left from the loop interval and sleep during the remaining time.
-                # Additionally set a lower limit of 0
-                freeTime = max(0, args.watch - (time.time() - loopTime))
-                time.sleep(freeTime)
-        except KeyboardInterrupt:
-            print("\nUser aborted watching by keyboard interrupt.")
+                            while time.time() - start < timeout:
+                                msg = midiIn.get_message()
+                                if not msg:
+                                    continue
+                                expectFloat = e["number"] & 0x2000
+                                if e["reading"]:
+                                    expectFloat = e["value"] & 0x2000
+                                sysex2fileOrConsole(msg[0], args.receive, args.output, "In", log_index, e["reading"], expectFloat)
+                                start = time.time()
+                    if not looping:
+                        # abort after 1 iteration without waiting.
+                        break
+                    # Measure how much time is left from the loop interval and sleep during the remaining time.
+                    # Additionally set a lower limit of 0
+                    freeTime = max(0, args.watch - (time.time() - loopTime))
+                    time.sleep(freeTime)
+            except KeyboardInterrupt:
+                print("\nUser aborted watching by keyboard interrupt.")
         del midiOut
         del midiIn
         print("Sent {} command(s) to MIDI port.".format(txCounter))